@@ -2,7 +2,6 @@ from tile import *
 from map import *
 import copy
 import random
-import csv
 
 #region All tiles
 t1 = Tile([(0,0),(3,0),(3,3),(0,3),(1,0),(2,0),(0,1),(0,2),(1,3),(2,3),(3,1),(3,2)], 
@@ -92,103 +91,65 @@ t14 = Tile([(0.0,0.0),(3.0,0.0),(3.0,3.0),(0.0,3.0),(1.0,0.0),(2.0,0.0),(0.0,1.0
 
 l = [t1, t2, t3, t4, t5, t6, t7, t8, t9, t10, t11, t12, t13, t14] # List of all tiles
 
-mask = [0,1,2,3,4,5,6,7,8,9,10,11,12,13] # Mask of all tiles
-mask_set = set()
-random.seed(50)
-random.shuffle(mask)
-
-map = Map(7, 2, "torus")
-
-for j in range(map.m):
-    for i in range(map.n):
-        t = copy.copy(l[mask[i+j*7]])
-        map.setTile(t, i, j)
-
-# Neighbours are set after all tiles are placed
-map.updateNeighbours()
-print(map.count_1d_components())
-print(map.count_2d_components())
-map.plot(color=True)
-
-"""
-while True:
-    random.shuffle(mask)
-    mask_tuple = tuple(mask)
-    if mask_tuple in mask_set:
-        continue
-    
-    mask_set.add(mask_tuple)
-
-    plane = Map(7, 2, "plane")   # Possible types: "plane", "cylinder", "torus"
-    cylinder = Map(7, 2, "cylinder")
-    torus = Map(7, 2, "torus")
-
-    for j in range(plane.m):
-        for i in range(plane.n):
-            t = copy.copy(l[mask[i+j*7]])
-            plane.setTile(t, i, j)
-
-            t = copy.copy(l[mask[i+j*7]])
-            cylinder.setTile(t, i, j)
-
-            t = copy.copy(l[mask[i+j*7]])
-            torus.setTile(t, i, j)
+# Names of the values in a row of the result files. Rows are written in this order to plane.csv, cylinder.csv and torus.csv.
+columns = ['Closed curves', 'Open curves', 'Total curves', 'Water components', 'Land components', 'Total components', 'Mask', 'Closed curve classes', 'Water component classes', 'Land component classes']
+# Columns with a single number, which are collected into histograms, and columns with counts per homology class
+histogram_columns = ['Closed curves', 'Open curves', 'Total curves', 'Water components', 'Land components', 'Total components']
+class_columns = ['Closed curve classes', 'Water component classes', 'Land component classes']
+
+def build_map(mask, type, n=7, m=2):
+    """
+    Places copies of the tiles on a new map in the order given by `mask`.
+
+    Args:
+        mask: Sequence of tile indices (into `l`) or (tile index, orientation) pairs, row by row starting at the bottom left.
+        type (str): Possible types: "plane", "cylinder", "torus".
+
+    Returns:
+        Map: Map with all tiles placed and neighbours set.
+    """
+    map = Map(n, m, type)
+    for j in range(map.m):
+        for i in range(map.n):
+            entry = mask[i+j*n]
+            tile_index, orientation = entry if isinstance(entry, tuple) else (entry, 0)
+            # setTile places a copy of an oriented variant itself, so only unrotated tiles are copied here
+            t = copy.copy(l[tile_index]) if orientation == 0 else l[tile_index]
+            map.setTile(t, i, j, orientation)
 
     # Neighbours are set after all tiles are placed
-    plane.updateNeighbours()  
-    cylinder.updateNeighbours()
-    torus.updateNeighbours()
-
-    # Open a CSV file in write mode
-    with open('plane.csv', mode='a', newline='') as file:
-        writer = csv.writer(file)
-
-        plane_1d = plane.count_1d_components()
-        loops = plane_1d[0]
-        open_path = plane_1d[1]
-        components_1d = plane_1d[2]
+    map.updateNeighbours()
+    return map
 
-        plane_2d = plane.count_2d_components()
-        water = plane_2d[0]
-        land = plane_2d[1]
-        components_2d = plane_2d[2]
-
-        # Write the data
-        writer.writerow([loops, open_path, components_1d, water, land, components_2d, mask_tuple])
-
-    # Open a CSV file in write mode
-    with open('cylinder.csv', mode='a', newline='') as file:
-        writer = csv.writer(file)
-
-        plane_1d = cylinder.count_1d_components()
-        loops = plane_1d[0]
-        open_path = plane_1d[1]
-        components_1d = plane_1d[2]
-
-        plane_2d = cylinder.count_2d_components()
-        water = plane_2d[0]
-        land = plane_2d[1]
-        components_2d = plane_2d[2]
-
-        # Write the data
-        writer.writerow([loops, open_path, components_1d, water, land, components_2d, mask_tuple])
-
-    # Open a CSV file in write mode
-    with open('torus.csv', mode='a', newline='') as file:
-        writer = csv.writer(file)
-
-        plane_1d = torus.count_1d_components()
-        loops = plane_1d[0]
-        open_path = plane_1d[1]
-        components_1d = plane_1d[2]
-
-        plane_2d = torus.count_2d_components()
-        water = plane_2d[0]
-        land = plane_2d[1]
-        components_2d = plane_2d[2]
-
-        # Write the data
-        writer.writerow([loops, open_path, components_1d, water, land, components_2d, mask_tuple])
-"""
+def evaluate_mask(mask, n=7, m=2):
+    """
+    Computes the statistics of a tile arrangement on the plane, cylinder and torus.
 
+    Returns:
+        dict: Map type -> row of values as listed in `columns`.
+    """
+    mask_tuple = tuple(mask)
+    rows = {}
+    for type in ["plane", "cylinder", "torus"]:
+        map = build_map(mask_tuple, type, n, m)
+        loops, open_path, components_1d, loop_classes = map.count_1d_components()
+        water, land, components_2d, water_classes, land_classes = map.count_2d_components()
+        rows[type] = [loops, open_path, components_1d, water, land, components_2d, mask_tuple, loop_classes, water_classes, land_classes]
+    return rows
+
+if __name__ == "__main__":
+    mask = [0,1,2,3,4,5,6,7,8,9,10,11,12,13] # Mask of all tiles
+    random.seed(50)
+    random.shuffle(mask)
 
+    map = build_map(mask, "torus")
+    print(map.count_1d_components())
+    print(map.count_2d_components())
+    map.plot(color=True)
+
+    # Endless sampling loop: random masks are evaluated in a worker pool and appended to plane.csv, cylinder.csv and torus.csv.
+    # For sampling that stops once the estimates converge, see sampling.py.
+    """
+    from pipeline import random_masks, CsvSink, run
+    run(random_masks(), [CsvSink(".")])
+    """
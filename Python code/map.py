@@ -1,7 +1,9 @@
 from tile import Tile
+import copy
 import matplotlib.pyplot as plt
 import networkx as nx
 from collections import defaultdict
+from math import gcd
 
 class Map:
     def __init__(self, n:int, m:int, type:str):
@@ -29,13 +31,19 @@ class Map:
             for tile in row:
                 yield tile
     
-    def setTile(self, tile: Tile, x: int, y: int):
+    def setTile(self, tile: Tile, x: int, y: int, orientation: int = 0):
+        # Oriented variants are cached by the tile, so a copy of the variant is placed on the map
+        if orientation != 0:
+            tile = copy.copy(tile.oriented(orientation))
         tile.x = x
         tile.y = y
         self.tiles[y][x] = tile
 
     def getTile(self, x: int, y: int) -> Tile:
         return self.tiles[y][x]
+
+    def getOrientation(self, x: int, y: int) -> int:
+        return self.tiles[y][x].orientation
     
     def updateNeighbours(self):
         if self.type == "plane":
@@ -93,10 +101,13 @@ class Map:
             tile_map: A Map of Tile objects.
 
         Returns:
-            (int, int): Tuple of number of simple closed curves and non-closed curves.
+            (int, int, int, dict): Tuple of number of simple closed curves, non-closed curves, all curves and
+            a dict mapping each homology class (winding vector) of the closed curves to the number of such curves.
         """
         # Graph structure to store all connections
         graph = defaultdict(list)
+        # Winding step (dx, dy) of every directed connection that goes over a seam of the cylinder or torus
+        crossings = {}
 
         # Add intra-tile connections
         for tile in self:
@@ -111,94 +122,114 @@ class Map:
         for i in range(self.m):  # Iterate over rows
             for j in range(self.n):  # Iterate over columns
                 tile = self.tiles[i][j]
-                edge_connections = []
-                for e in [tile.edges[edge_index] for edge_index in tile.connections]:
-                    edge_connections.extend(e)
+                edge_connections = tile.connected_points
 
                 # Match left edge with right edge of the left neighbour
                 if tile.left_neighbour is not None:
                     left_neighbour = tile.left_neighbour
                     for p1, p2 in zip(tile.left_edge, left_neighbour.right_edge):
-                        p1_index = tile.points.index(p1)
+                        p1_index = tile.point_index[p1]
                         if p1_index in edge_connections:
                             p1_global = tile.get_global_coordinates(p1)
                             p2_global = left_neighbour.get_global_coordinates(p2)
                             if p1_global != p2_global:
                                 graph[p1_global].append(p2_global)
                                 graph[p2_global].append(p1_global)
+                                # Points only differ when the connection goes over a seam, so record the winding step
+                                step = tile.seamCrossing("left")
+                                crossings[(p1_global, p2_global)] = step
+                                crossings[(p2_global, p1_global)] = (-step[0], -step[1])
                 
                 # Match right edge with left edge of the right neighbour
                 if tile.right_neighbour is not None:
                     right_neighbour = tile.right_neighbour
                     for p1, p2 in zip(tile.right_edge, right_neighbour.left_edge):
-                        p1_index = tile.points.index(p1)
+                        p1_index = tile.point_index[p1]
                         if p1_index in edge_connections:
                             p1_global = tile.get_global_coordinates(p1)
                             p2_global = right_neighbour.get_global_coordinates(p2)
                             if p1_global != p2_global:
                                 graph[p1_global].append(p2_global)
                                 graph[p2_global].append(p1_global)
+                                # Points only differ when the connection goes over a seam, so record the winding step
+                                step = tile.seamCrossing("right")
+                                crossings[(p1_global, p2_global)] = step
+                                crossings[(p2_global, p1_global)] = (-step[0], -step[1])
                 
                 # Match top edge with bottom edge of the top neighbour
                 if tile.top_neighbour is not None:
                     top_neighbour = tile.top_neighbour
                     for p1, p2 in zip(tile.top_edge, top_neighbour.bottom_edge):
-                        p1_index = tile.points.index(p1)
+                        p1_index = tile.point_index[p1]
                         if p1_index in edge_connections:
                             p1_global = tile.get_global_coordinates(p1)
                             p2_global = top_neighbour.get_global_coordinates(p2)
                             if p1_global != p2_global:
                                 graph[p1_global].append(p2_global)
                                 graph[p2_global].append(p1_global)
+                                # Points only differ when the connection goes over a seam, so record the winding step
+                                step = tile.seamCrossing("top")
+                                crossings[(p1_global, p2_global)] = step
+                                crossings[(p2_global, p1_global)] = (-step[0], -step[1])
                 
                 # Match bottom edge with top edge of the bottom neighbour
                 if tile.bottom_neighbour is not None:
                     bottom_neighbour = tile.bottom_neighbour
                     for p1, p2 in zip(tile.bottom_edge, bottom_neighbour.top_edge):
-                        p1_index = tile.points.index(p1)
+                        p1_index = tile.point_index[p1]
                         if p1_index in edge_connections:
                             p1_global = tile.get_global_coordinates(p1)
                             p2_global = bottom_neighbour.get_global_coordinates(p2)
                             if p1_global != p2_global:
                                 graph[p1_global].append(p2_global)
                                 graph[p2_global].append(p1_global)
+                                # Points only differ when the connection goes over a seam, so record the winding step
+                                step = tile.seamCrossing("bottom")
+                                crossings[(p1_global, p2_global)] = step
+                                crossings[(p2_global, p1_global)] = (-step[0], -step[1])
 
         def path_type(point):
             """
             Determines if starting at `point`, we can find a simple closed curve (cycle).
             Returns:
-                - "Loop" if a cycle (closed curve) is found.
-                - "Open" if it's an open path (non-closed curve).
-                - None if the point beloongs to a previously detected path.
+                - ("Loop", winding) if a cycle (closed curve) is found. Winding is the number of times
+                  the cycle wraps around the map horizontally and vertically.
+                - ("Open", None) if it's an open path (non-closed curve).
+                - (None, None) if the point beloongs to a previously detected path.
             """
             current = point
             prev = None  # Keep track of the previous point to avoid reversing the path
+            winding = (0, 0)
             while True:
                 visited.add(current)
                 neighbours = graph[current]  # At most length 2 (every point has at most 2 connections)
                 if len(neighbours) < 2:
-                    return "Open"  # Open path, not a cycle
+                    return "Open", None  # Open path, not a cycle
                 # Find the next point in the path that isn't the previous point
                 next_point = neighbours[0] if neighbours[0] != prev else neighbours[1]
+                step = crossings.get((current, next_point), (0, 0))
+                winding = (winding[0] + step[0], winding[1] + step[1])
                 if next_point in visited:
                     if next_point == point:
-                        return "Loop"  # Cycle found
-                    return None  # Already visited point, not a cycle
+                        return "Loop", winding  # Cycle found
+                    return None, None  # Already visited point, not a cycle
                 prev = current
                 current = next_point
 
         # Initialize counters for loops (closed curves) and open paths (non-closed curves)
         loops = 0
         open_paths = 0
+        loop_classes = defaultdict(int)  # Number of loops in each homology class
 
         visited = set()
 
         # Traverse all nodes
         for point in graph.keys():
             if point not in visited:
-                type = path_type(point)
+                type, winding = path_type(point)
                 if type == "Loop":  # If a cycle is detected
                     loops += 1
+                    loop_classes[normalize_winding(winding)] += 1
                 elif type == "Open":  # If it's an open path
                     open_paths += 1
 
@@ -216,14 +247,25 @@ class Map:
 
         components = list(nx.connected_components(G))
 
-        return (loops, int(open_paths / 2), len(components)) # We overcounted open paths by a factor of 2
+        return (loops, int(open_paths / 2), len(components), dict(sorted(loop_classes.items()))) # We overcounted open paths by a factor of 2
 
     def count_2d_components(self):
+        """
+        Counts the number of 2-dimensional components (water and land regions) in a map of tiles.
+
+        Returns:
+            (int, int, int, dict, dict): Tuple of number of water, land and all components and two dicts
+            (water, land) mapping each homology class of the regions to the number of such regions.
+            The class of a region is the basis of the winding vectors of loops inside it (see `lattice_basis`),
+            so () means that the region does not wrap around the map.
+        """
         # Graph structure to store all connections
         graph = defaultdict(list)
+        # Winding step (dx, dy) of every pair of neighbouring triangles that lie on opposite sides of a seam
+        crossings = {}
 
         for tile in self:
-            triangle_neighbors = tile.getTriangleNeighbours()
+            triangle_neighbors = tile.getTriangleNeighbours(crossings)
             for t, neighbours in triangle_neighbors.items():
                 graph[t] = []
                 for neighbor in neighbours:
@@ -244,9 +286,12 @@ class Map:
         components = list(nx.connected_components(G))
         land = 0
         water = 0
+        water_classes = defaultdict(int)
+        land_classes = defaultdict(int)
         for component in components:
             # First triangle in the component
             t = component.pop()
+            region_class = region_homology_class(t, graph, crossings)
             # Compute centroid
             x = (t[0][0] + t[1][0] + t[2][0]) / 3
             y = (t[0][1] + t[1][1] + t[2][1]) / 3
@@ -260,11 +305,85 @@ class Map:
             triangle_color = tile.getTriangleColor(triangle)
             if triangle_color == 0:
                 water += 1
+                water_classes[region_class] += 1
             else:
                 land += 1
-        return (water, land, len(components))
+                land_classes[region_class] += 1
+        return (water, land, len(components), dict(sorted(water_classes.items())), dict(sorted(land_classes.items())))
 
 ####################################################################################################        
+def normalize_winding(winding):
+    """
+    Returns the winding vector of a closed curve with its first non-zero coordinate positive,
+    so that both orientations of the same curve belong to the same homology class.
+    """
+    if winding[0] < 0 or (winding[0] == 0 and winding[1] < 0):
+        return (-winding[0], -winding[1])
+    return winding
+
+def lattice_basis(vectors):
+    """
+    Computes the basis (in Hermite normal form) of the lattice spanned by 2D integer vectors.
+
+    Args:
+        vectors: Iterable of integer vectors (dx, dy).
+
+    Returns:
+        tuple: () for the trivial lattice, ((a, b),) for a lattice of rank 1 and ((a, b), (0, d)) for rank 2.
+    """
+    first = None  # Basis vector with non-zero first coordinate
+    second = 0  # Generator of the vectors with zero first coordinate
+    for v in vectors:
+        # Euclidean algorithm on the first coordinates
+        while v[0] != 0:
+            if first is None:
+                first, v = v, (0, 0)
+                break
+            q = v[0] // first[0]
+            v = (v[0] - q * first[0], v[1] - q * first[1])
+            if v[0] != 0:
+                first, v = v, first
+        second = gcd(second, v[1])
+
+    if first is None:
+        return ((0, second),) if second != 0 else ()
+    if first[0] < 0:
+        first = (-first[0], -first[1])
+    if second == 0:
+        return (first,)
+    return ((first[0], first[1] % second), (0, second))
+
+def region_homology_class(start, graph, crossings):
+    """
+    Determines how a region of triangles wraps around the map.
+
+    Walks the region from `start` and tracks in which copy of the map (seam crossings so far) each triangle
+    is reached. Reaching a triangle again in a different copy closes a loop with that winding vector.
+
+    Args:
+        start: Triangle in the region.
+        graph (defaultdict): Adjacency list of triangles.
+        crossings (dict): Winding step of every pair of neighbouring triangles that cross a seam.
+
+    Returns:
+        tuple: Basis of the winding vectors of loops in the region (see `lattice_basis`).
+    """
+    offsets = {start: (0, 0)}
+    queue = [start]
+    windings = set()
+    while queue:
+        current = queue.pop()
+        offset = offsets[current]
+        for neighbour in graph[current]:
+            step = crossings.get((current, neighbour), (0, 0))
+            neighbour_offset = (offset[0] + step[0], offset[1] + step[1])
+            if neighbour not in offsets:
+                offsets[neighbour] = neighbour_offset
+                queue.append(neighbour)
+            elif offsets[neighbour] != neighbour_offset:
+                windings.add((neighbour_offset[0] - offsets[neighbour][0], neighbour_offset[1] - offsets[neighbour][1]))
+    return lattice_basis(windings)
+
 def visualize_graph(graph):
     """
     Visualizes the graph using networkx and matplotlib.
@@ -0,0 +1,330 @@
+"""
+Streaming pipeline: mask source -> evaluator -> sinks.
+
+Sources are generators that lazily yield batches of masks. Batches are evaluated in a pool of worker processes
+and the results are passed to sinks (CSV files, binary store, histograms). The stages are connected by a bounded
+queue, so generating masks, evaluating them and writing results overlap while memory stays bounded.
+
+Usage:
+    python pipeline.py random --count 10000 --csv-dir Data --workers 4
+    python pipeline.py enumerate --start 0 --stop 100000 --store results.pkl --histograms histograms.json
+    python pipeline.py file Data/plane.csv --histograms histograms.json
+"""
+import argparse
+import ast
+import asyncio
+import csv
+import json
+import os
+import pickle
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from main import l, columns, evaluate_mask
+from shard import new_histograms, add_row, permutations_in_range
+
+#region Sources
+def random_masks(batch_size=100, count=None, seed=None, unique=False, orientations=False):
+    """
+    Yields batches of random masks. Runs forever if `count` is None.
+    If `unique` is set, masks that were already generated are skipped. All generated masks are kept in memory,
+    so memory grows with `count` and `unique` can only be used together with `count`.
+    If `orientations` is set, every tile also gets a random orientation, i.e. masks consist of (tile, orientation) pairs.
+    """
+    if unique and count is None:
+        raise ValueError("Unique masks need a count, as all generated masks are kept in memory.")
+    return _random_masks(batch_size, count, seed, unique, orientations)
+
+def _random_masks(batch_size, count, seed, unique, orientations):
+    rng = random.Random(seed)
+    mask = list(range(len(l)))
+    mask_set = set()
+    generated = 0
+    batch = []
+    while count is None or generated < count:
+        rng.shuffle(mask)
+        if orientations:
+            mask_tuple = tuple((tile, rng.randrange(8)) for tile in mask)
+        else:
+            mask_tuple = tuple(mask)
+        if unique:
+            if mask_tuple in mask_set:
+                continue
+            mask_set.add(mask_tuple)
+        batch.append(mask_tuple)
+        generated += 1
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def enumerated_masks(start, stop, batch_size=100):
+    """
+    Yields batches of the masks with permutation ranks (Lehmer code) in [start, stop).
+    """
+    batch = []
+    for mask in permutations_in_range(start, stop, len(l)):
+        batch.append(mask)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def file_masks(path, batch_size=100):
+    """
+    Yields batches of masks read from a file. The file is either a result CSV file (masks are taken from
+    the 'Mask' column, in rows with the original 7 or all 10 values) or has one mask per line,
+    e.g. "0,1,2,...,13", "(0, 1, 2, ..., 13)" or "(0, 5), (1, 0), ..." for (tile, orientation) pairs.
+
+    Raises:
+        ValueError: If a line does not contain a valid mask.
+    """
+    batch = []
+    with open(path, newline='') as file:
+        for line, row in enumerate(csv.reader(file), start=1):
+            if not row:
+                continue
+            try:
+                if len(row) in (columns.index('Mask') + 1, len(columns)):
+                    mask = ast.literal_eval(row[columns.index('Mask')])
+                else:
+                    mask = ast.literal_eval(",".join(row))
+            except (ValueError, SyntaxError):
+                raise ValueError(f"{path}:{line}: could not parse the mask.")
+            if not _is_mask(mask):
+                raise ValueError(f"{path}:{line}: expected {len(l)} tile indices or (tile, orientation) pairs, got {mask!r}.")
+            batch.append(tuple(mask))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _is_mask(mask):
+    # Every tile exactly once, each given by its index or by a (tile index, orientation) pair
+    if not isinstance(mask, (tuple, list)) or len(mask) != len(l):
+        return False
+    tiles = []
+    for entry in mask:
+        if isinstance(entry, tuple):
+            if len(entry) != 2 or entry[1] not in range(8):
+                return False
+            entry = entry[0]
+        tiles.append(entry)
+    return sorted(tiles) == list(range(len(l)))
+#endregion
+
+#region Sinks
+class CsvSink:
+    """
+    Appends rows to plane.csv, cylinder.csv and torus.csv in `directory`, in the format read by the notebook.
+    Rows whose mask consists of (tile, orientation) pairs come from a different distribution (orientation-aware),
+    so they are appended to oriented_plane.csv, oriented_cylinder.csv and oriented_torus.csv instead.
+    """
+    def __init__(self, directory="."):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {}
+        self.writers = {}
+
+    def _writer(self, type, oriented):
+        # Files are opened when the first row is written to them, so no empty oriented files are created
+        name = f"oriented_{type}.csv" if oriented else f"{type}.csv"
+        if name not in self.writers:
+            self.files[name] = open(os.path.join(self.directory, name), mode='a', newline='')
+            self.writers[name] = csv.writer(self.files[name])
+        return self.writers[name]
+
+    def write(self, results):
+        for rows in results:
+            for type, row in rows.items():
+                oriented = any(isinstance(entry, tuple) for entry in row[columns.index('Mask')])
+                self._writer(type, oriented).writerow(row)
+
+    def close(self, complete=True):
+        for file in self.files.values():
+            file.close()
+
+class BinarySink:
+    """
+    Appends every batch of results to a binary store as a pickled list. Read it back with `read_store`.
+    """
+    def __init__(self, path):
+        self.file = open(path, "ab")
+
+    def write(self, results):
+        pickle.dump(results, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self, complete=True):
+        self.file.close()
+
+class HistogramSink:
+    """
+    Aggregates results into histograms (the same format as the merged shards) and writes them to `path` on close.
+    Nothing is written if the run failed, so an existing file is never replaced by partial histograms.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.histograms = new_histograms()
+        self.count = 0
+
+    def write(self, results):
+        for rows in results:
+            for type, row in rows.items():
+                add_row(self.histograms, type, row)
+            self.count += 1
+
+    def close(self, complete=True):
+        if complete and self.path is not None:
+            with open(self.path, "w") as file:
+                json.dump({"count": self.count, "histograms": self.histograms}, file, indent=2)
+
+def read_store(path):
+    """
+    Yields the results (dict: map type -> row) saved by `BinarySink`.
+    """
+    with open(path, "rb") as file:
+        while True:
+            try:
+                results = pickle.load(file)
+            except EOFError:
+                return
+            yield from results
+#endregion
+
+#region Pipeline
+def evaluate_batch(masks):
+    return [evaluate_mask(mask) for mask in masks]
+
+def _write(sinks, results):
+    for sink in sinks:
+        sink.write(results)
+
+async def run_async(source, sinks, workers=None, max_pending=None):
+    """
+    Evaluates all batches of `source` in a process pool and passes the results to `sinks` in source order.
+
+    Args:
+        source: Iterator of batches of masks.
+        sinks: Objects with `write(results)` and `close(complete)` methods. They are closed at the end,
+            with `complete` False if the run failed.
+        workers (int): Number of worker processes. Defaults to the number of CPUs.
+        max_pending (int): Largest number of batches that are read from the source but not yet written.
+            When reached, the source is not read until a batch is written (backpressure).
+
+    Returns:
+        int: Number of evaluated masks.
+    """
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    if max_pending < 1:
+        raise ValueError("Number of pending batches must be positive.")
+    loop = asyncio.get_running_loop()
+    # A slot is taken before a batch is read from the source and given back once the batch is written
+    slots = asyncio.Semaphore(max_pending)
+    queue = asyncio.Queue()
+    source = iter(source)
+    count = 0
+
+    async def produce():
+        try:
+            while True:
+                await slots.acquire()
+                # The source may read from a file, so it runs in a thread to not block the event loop
+                batch = await asyncio.to_thread(next, source, None)
+                if batch is None:
+                    slots.release()
+                    break
+                await queue.put(loop.run_in_executor(executor, evaluate_batch, batch))
+        finally:
+            # Also when the source fails, so that the consumer finishes the batches in flight and stops
+            queue.put_nowait(None)
+
+    async def consume():
+        nonlocal count
+        while True:
+            future = await queue.get()
+            if future is None:
+                break
+            results = await future
+            # Writing runs in a thread, so the next batches are evaluated while I/O is in flight
+            await asyncio.to_thread(_write, sinks, results)
+            count += len(results)
+            slots.release()
+
+    complete = False
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            producer = asyncio.create_task(produce())
+            try:
+                # The consumer runs here and not in a task, so when it returns or raises its last write has finished
+                await consume()
+            except BaseException:
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+                raise
+            await producer
+        complete = True
+    finally:
+        for sink in sinks:
+            sink.close(complete)
+    return count
+
+def run(source, sinks, workers=None, max_pending=None):
+    """
+    Synchronous front end of `run_async`.
+    """
+    return asyncio.run(run_async(source, sinks, workers, max_pending))
+#endregion
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a stream of tile arrangements.")
+    sources = parser.add_subparsers(dest="source", required=True)
+
+    random_parser = sources.add_parser("random", help="Random masks.")
+    random_parser.add_argument("--count", type=int, default=None, help="Number of masks. Runs forever if not given.")
+    random_parser.add_argument("--seed", type=int, default=None)
+    random_parser.add_argument("--unique", action="store_true", help="Skip masks that were already generated. Needs --count.")
+    random_parser.add_argument("--orientations", action="store_true", help="Place tiles in random orientations. CSV rows go to oriented_*.csv.")
+
+    enumerate_parser = sources.add_parser("enumerate", help="Masks with permutation ranks in [start, stop).")
+    enumerate_parser.add_argument("--start", type=int, required=True)
+    enumerate_parser.add_argument("--stop", type=int, required=True)
+
+    file_parser = sources.add_parser("file", help="Masks read from a file.")
+    file_parser.add_argument("path")
+
+    for source_parser in [random_parser, enumerate_parser, file_parser]:
+        source_parser.add_argument("--batch-size", type=int, default=100)
+        source_parser.add_argument("--workers", type=int, default=None)
+        source_parser.add_argument("--max-pending", type=int, default=None, help="Largest number of batches in flight.")
+        source_parser.add_argument("--csv-dir", default=None, help="Directory to append the CSV rows to.")
+        source_parser.add_argument("--store", default=None, help="Binary store to append the results to.")
+        source_parser.add_argument("--histograms", default=None, help="JSON file for the aggregated histograms.")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.source == "random":
+            source = random_masks(args.batch_size, args.count, args.seed, args.unique, args.orientations)
+        elif args.source == "enumerate":
+            source = enumerated_masks(args.start, args.stop, args.batch_size)
+        else:
+            source = file_masks(args.path, args.batch_size)
+
+        sinks = []
+        if args.csv_dir is not None:
+            sinks.append(CsvSink(args.csv_dir))
+        if args.store is not None:
+            sinks.append(BinarySink(args.store))
+        if args.histograms is not None:
+            sinks.append(HistogramSink(args.histograms))
+
+        print(f"Evaluated {run(source, sinks, args.workers, args.max_pending)} masks.")
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
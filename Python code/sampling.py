@@ -0,0 +1,229 @@
+"""
+Adaptive Monte Carlo sampling of tile arrangements.
+
+Random arrangements are evaluated until the confidence intervals of all estimates are narrow enough:
+the probability of every value in the histograms of `histogram_columns` and the mean of every such column,
+for each map type. Optionally the arrangements are stratified by the set of tiles in the first column
+(or row) of the map, which removes the variance between strata from the estimates.
+
+Usage:
+    python sampling.py --precision 0.01 --mean-precision 0.05 [--stratify column] [--csv-dir Data] [--out summary.json]
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+from collections import Counter, defaultdict
+from statistics import NormalDist
+
+from main import l, columns, histogram_columns, evaluate_mask
+
+types = ["plane", "cylinder", "torus"]
+
+class Estimates:
+    """
+    Stratified estimates of the histogram probabilities and column means.
+    Without stratification there is a single stratum () with weight 1.
+    """
+    def __init__(self, weights):
+        self.weights = weights                  # Stratum -> probability of the stratum
+        self.n = Counter()                      # Stratum -> number of samples
+        self.values = defaultdict(Counter)      # (stratum, type, column) -> value -> number of samples
+        self.sums = defaultdict(float)          # (stratum, type, column) -> sum of values
+        self.squares = defaultdict(float)       # (stratum, type, column) -> sum of squared values
+
+    def add(self, stratum, rows):
+        self.n[stratum] += 1
+        for type in types:
+            for column in histogram_columns:
+                value = rows[type][columns.index(column)]
+                self.values[(stratum, type, column)][value] += 1
+                self.sums[(stratum, type, column)] += value
+                self.squares[(stratum, type, column)] += value * value
+
+    def samples(self):
+        return sum(self.n.values())
+
+    def _combine(self, stratum_moments):
+        # Combines (mean, variance of one sample) of every stratum into the estimate and the variance of the estimate.
+        # Weights are renormalized over the sampled strata, in case sampling stopped before all strata were reached.
+        total_weight = sum(self.weights[stratum] for stratum in stratum_moments)
+        estimate = 0
+        variance = 0
+        for stratum, (mean, sample_variance) in stratum_moments.items():
+            w = self.weights[stratum] / total_weight
+            estimate += w * mean
+            variance += w * w * sample_variance / self.n[stratum]
+        return estimate, variance
+
+    def probabilities(self, z):
+        """
+        Returns:
+            dict: (type, column, value) -> (estimated probability, half-width of the confidence interval).
+        """
+        observed = defaultdict(set)
+        for (_, type, column), counter in self.values.items():
+            observed[(type, column)].update(counter)
+
+        result = {}
+        for (type, column), values in observed.items():
+            for value in values:
+                moments = {}
+                for stratum, n in self.n.items():
+                    p = self.values[(stratum, type, column)][value] / n
+                    moments[stratum] = (p, p * (1 - p) * n / max(n - 1, 1))
+                estimate, variance = self._combine(moments)
+                result[(type, column, value)] = (estimate, z * math.sqrt(variance))
+        return result
+
+    def means(self, z):
+        """
+        Returns:
+            dict: (type, column) -> (estimated mean, half-width of the confidence interval).
+        """
+        result = {}
+        for type in types:
+            for column in histogram_columns:
+                moments = {}
+                for stratum, n in self.n.items():
+                    mean = self.sums[(stratum, type, column)] / n
+                    sample_variance = max(self.squares[(stratum, type, column)] - n * mean * mean, 0) / max(n - 1, 1)
+                    moments[stratum] = (mean, sample_variance)
+                estimate, variance = self._combine(moments)
+                result[(type, column)] = (estimate, z * math.sqrt(variance))
+        return result
+
+    def converged(self, z, precision, mean_precision):
+        # Every stratum needs at least 2 samples for its variance
+        if len(self.n) < len(self.weights) or min(self.n.values()) < 2:
+            return False
+        if any(half_width > precision for _, half_width in self.probabilities(z).values()):
+            return False
+        return all(half_width <= mean_precision for _, half_width in self.means(z).values())
+
+def stratum_cells(stratify, n, m):
+    """
+    Returns the indices (in a mask) of the cells whose tiles define the stratum of an arrangement.
+    """
+    if stratify is None:
+        return []
+    if stratify == "column":
+        return [j * n for j in range(m)]
+    if stratify == "row":
+        return list(range(n))
+    raise ValueError(f"Unknown stratification {stratify}.")
+
+def random_mask(rng, stratum, cells, size):
+    """
+    Returns a uniformly random arrangement whose tiles in `cells` are exactly the tiles in `stratum`.
+    """
+    inside = list(stratum)
+    outside = [t for t in range(size) if t not in stratum]
+    rng.shuffle(inside)
+    rng.shuffle(outside)
+    mask = []
+    for i in range(size):
+        mask.append(inside.pop() if i in cells else outside.pop())
+    return mask
+
+def adaptive_sample(precision=0.01, mean_precision=0.05, confidence=0.95, stratify=None, min_samples=100, max_samples=None, seed=None, csv_dir=None, n=7, m=2):
+    """
+    Samples random arrangements until all confidence intervals are narrow enough.
+
+    Args:
+        precision (float): Largest allowed half-width of the confidence interval of a histogram probability.
+        mean_precision (float): Largest allowed half-width of the confidence interval of a column mean.
+        confidence (float): Confidence level of the intervals (normal approximation).
+        stratify (str): None, "column" or "row". Strata are the sets of tiles in the first column or row,
+            which are all equally likely. Samples are allocated to the strata in turn.
+        min_samples (int): Number of samples before convergence is first checked.
+        max_samples (int): Stop after this many samples even if the estimates did not converge.
+        seed: Seed of the random generator.
+        csv_dir (str): If given, rows are also appended to plane.csv, cylinder.csv and torus.csv in this directory.
+
+    Returns:
+        (Estimates, bool): The estimates and whether they converged.
+    """
+    rng = random.Random(seed)
+    size = len(l)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    cells = stratum_cells(stratify, n, m)
+    strata = list(itertools.combinations(range(size), len(cells)))
+    estimates = Estimates({s: 1 / len(strata) for s in strata})
+    # Checking convergence once per round over all strata keeps the allocation balanced and the checks cheap
+    check_every = max(len(strata), 50)
+
+    files = {}
+    writers = {}
+    if csv_dir is not None:
+        os.makedirs(csv_dir, exist_ok=True)
+        for type in types:
+            files[type] = open(os.path.join(csv_dir, f"{type}.csv"), mode='a', newline='')
+            writers[type] = csv.writer(files[type])
+
+    converged = False
+    try:
+        for stratum in itertools.cycle(strata):
+            mask = random_mask(rng, set(stratum), cells, size)
+            rows = evaluate_mask(mask, n, m)
+            estimates.add(stratum, rows)
+            for type, writer in writers.items():
+                writer.writerow(rows[type])
+
+            samples = estimates.samples()
+            if samples >= min_samples and samples % check_every == 0 and estimates.converged(z, precision, mean_precision):
+                converged = True
+                break
+            if max_samples is not None and samples >= max_samples:
+                break
+    finally:
+        for file in files.values():
+            file.close()
+
+    return estimates, converged
+
+def summary(estimates, confidence=0.95):
+    """
+    Returns the estimates as a JSON serializable dict: type -> column -> mean and histogram, each with the half-width.
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    result = {type: {column: {"histogram": {}} for column in histogram_columns} for type in types}
+    for (type, column), (mean, half_width) in estimates.means(z).items():
+        result[type][column]["mean"] = [mean, half_width]
+    for (type, column, value), (p, half_width) in sorted(estimates.probabilities(z).items()):
+        result[type][column]["histogram"][str(value)] = [p, half_width]
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sample tile arrangements until the estimates converge.")
+    parser.add_argument("--precision", type=float, default=0.01, help="Half-width of the intervals of histogram probabilities.")
+    parser.add_argument("--mean-precision", type=float, default=0.05, help="Half-width of the intervals of column means.")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--stratify", choices=["column", "row"], default=None)
+    parser.add_argument("--min-samples", type=int, default=100)
+    parser.add_argument("--max-samples", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--csv-dir", default=None, help="Directory to append the sampled rows to.")
+    parser.add_argument("--out", default=None, help="JSON file for the estimates.")
+    args = parser.parse_args(argv)
+
+    estimates, converged = adaptive_sample(args.precision, args.mean_precision, args.confidence, args.stratify,
+                                           args.min_samples, args.max_samples, args.seed, args.csv_dir)
+    result = summary(estimates, args.confidence)
+
+    print(f"{'Converged' if converged else 'Not converged'} after {estimates.samples()} samples.")
+    for type in types:
+        for column in histogram_columns:
+            mean, half_width = result[type][column]["mean"]
+            print(f"{type:9} {column:17} {mean:.3f} ± {half_width:.3f}")
+
+    if args.out is not None:
+        with open(args.out, "w") as file:
+            json.dump({"samples": estimates.samples(), "converged": converged, "estimates": result}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
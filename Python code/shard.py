@@ -0,0 +1,297 @@
+"""
+Sharded enumeration of tile arrangements.
+
+The arrangements (permutations of all tiles) are numbered by their lexicographic rank (Lehmer code),
+so the whole space can be split into deterministic ranges of ranks. Every shard is evaluated independently
+and writes its own partial file, which are later merged into the final histograms.
+
+Usage:
+    python shard.py plan manifest.json --shards 4 [--start 0 --stop 1000]
+    python shard.py run manifest.json --shard 2 --out-dir parts
+    python shard.py local manifest.json --out-dir parts --workers 4
+    python shard.py merge manifest.json parts/*.json --out result.json
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+from main import l, columns, histogram_columns, class_columns, evaluate_mask
+
+#region Lehmer code
+def unrank(rank, size):
+    """
+    Returns the permutation of range(size) with the given lexicographic rank (Lehmer code).
+    """
+    if not 0 <= rank < math.factorial(size):
+        raise ValueError(f"Rank {rank} out of range for permutations of {size} elements.")
+    elements = list(range(size))
+    permutation = []
+    for i in range(size - 1, -1, -1):
+        index, rank = divmod(rank, math.factorial(i))
+        permutation.append(elements.pop(index))
+    return permutation
+
+def next_permutation(permutation):
+    """
+    Rearranges the list into the lexicographically next permutation in place. Returns False if it was the last one.
+    """
+    i = len(permutation) - 2
+    while i >= 0 and permutation[i] >= permutation[i + 1]:
+        i -= 1
+    if i < 0:
+        return False
+    j = len(permutation) - 1
+    while permutation[j] <= permutation[i]:
+        j -= 1
+    permutation[i], permutation[j] = permutation[j], permutation[i]
+    permutation[i + 1:] = reversed(permutation[i + 1:])
+    return True
+
+def permutations_in_range(start, stop, size):
+    """
+    Yields the permutations of range(size) with ranks in [start, stop), in lexicographic order.
+    """
+    if start >= stop:
+        return
+    permutation = unrank(start, size)
+    for _ in range(stop - start):
+        yield tuple(permutation)
+        next_permutation(permutation)
+#endregion
+
+#region Manifest
+def make_manifest(shards, start=0, stop=None, size=len(l)):
+    """
+    Splits the ranks [start, stop) into `shards` contiguous ranges of (almost) equal length.
+
+    Returns:
+        dict: Manifest with the rank range, the shards and a fingerprint identifying it.
+    """
+    total = math.factorial(size)
+    if stop is None:
+        stop = total
+    if not 0 <= start < stop <= total:
+        raise ValueError(f"Invalid rank range [{start}, {stop}) for {total} permutations.")
+    if shards < 1:
+        raise ValueError("Number of shards must be positive.")
+
+    length, extra = divmod(stop - start, shards)
+    ranges = []
+    begin = start
+    for i in range(shards):
+        end = begin + length + (1 if i < extra else 0)
+        ranges.append({"id": i, "start": begin, "stop": end})
+        begin = end
+
+    manifest = {"size": size, "start": start, "stop": stop, "shards": ranges}
+    manifest["fingerprint"] = fingerprint(manifest)
+    return manifest
+
+def fingerprint(manifest):
+    """
+    Returns a hash of the shard ranges, so that partials of different manifests are never mixed.
+    """
+    data = json.dumps([manifest["size"], manifest["shards"]], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+def load_manifest(path):
+    with open(path) as file:
+        manifest = json.load(file)
+    if manifest.get("fingerprint") != fingerprint(manifest):
+        raise ValueError(f"Manifest {path} was modified after it was planned.")
+    return manifest
+
+def partial_path(out_dir, shard_id):
+    return os.path.join(out_dir, f"shard_{shard_id:05d}.json")
+
+def is_complete(manifest, out_dir, shard_id):
+    """
+    Returns True if the partial file of the shard exists and was written for this manifest.
+    Partials left in `out_dir` by another manifest do not count and are overwritten when the shard runs.
+    """
+    path = partial_path(out_dir, shard_id)
+    if not os.path.exists(path):
+        return False
+    with open(path) as file:
+        return json.load(file).get("fingerprint") == manifest["fingerprint"]
+#endregion
+
+#region Running and merging shards
+def new_histograms():
+    """
+    Returns empty histograms: map type -> column -> value -> count.
+    """
+    return defaultdict(lambda: defaultdict(Counter))
+
+def add_row(histograms, type, row):
+    for column in histogram_columns:
+        histograms[type][column][str(row[columns.index(column)])] += 1
+    for column in class_columns:
+        for homology_class, count in row[columns.index(column)].items():
+            histograms[type][column][str(homology_class)] += count
+
+def run_shard(manifest, shard_id, out_dir):
+    """
+    Evaluates all arrangements of a shard and writes its partial file.
+    Shards whose partial file of this manifest already exists are complete and are skipped.
+
+    Returns:
+        str: Path of the partial file.
+    """
+    if not 0 <= shard_id < len(manifest["shards"]):
+        raise ValueError(f"Shard {shard_id} is not in the manifest.")
+    shard = manifest["shards"][shard_id]
+    path = partial_path(out_dir, shard_id)
+    if is_complete(manifest, out_dir, shard_id):
+        return path
+
+    histograms = new_histograms()
+    count = 0
+    for mask in permutations_in_range(shard["start"], shard["stop"], manifest["size"]):
+        for type, row in evaluate_mask(mask).items():
+            add_row(histograms, type, row)
+        count += 1
+
+    partial = {
+        "fingerprint": manifest["fingerprint"],
+        "shard": shard_id,
+        "start": shard["start"],
+        "stop": shard["stop"],
+        "count": count,
+        "histograms": histograms,
+    }
+
+    # Write to a temporary file first, so that an existing partial file is always complete
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(partial, file)
+    os.replace(tmp_path, path)
+    return path
+
+def run_local(manifest_path, out_dir, workers):
+    """
+    Runs all incomplete shards as separate processes (stand-ins for nodes), at most `workers` at a time.
+    A new shard is started as soon as any running one finishes.
+    """
+    if workers < 1:
+        raise ValueError("Number of workers must be positive.")
+    manifest = load_manifest(manifest_path)
+    pending = [s["id"] for s in manifest["shards"] if not is_complete(manifest, out_dir, s["id"])]
+    running = []
+    failed = []
+    while pending or running:
+        while pending and len(running) < workers:
+            shard_id = pending.pop(0)
+            command = [sys.executable, os.path.abspath(__file__), "run", manifest_path, "--shard", str(shard_id), "--out-dir", out_dir]
+            running.append((shard_id, subprocess.Popen(command)))
+        time.sleep(0.1)
+        still_running = []
+        for shard_id, process in running:
+            returncode = process.poll()
+            if returncode is None:
+                still_running.append((shard_id, process))
+            elif returncode != 0:
+                failed.append(shard_id)
+        running = still_running
+    if failed:
+        raise RuntimeError(f"Shards {failed} failed.")
+
+def merge_partials(manifest, paths, allow_missing=False):
+    """
+    Combines partial files of a manifest into final histograms.
+
+    Raises:
+        ValueError: If a partial belongs to another manifest or does not match its shard range,
+            if a shard is present more than once or if shards are missing (unless `allow_missing`).
+    """
+    histograms = new_histograms()
+    seen = {}
+    count = 0
+    for path in paths:
+        with open(path) as file:
+            partial = json.load(file)
+
+        shard_id = partial["shard"]
+        if partial["fingerprint"] != manifest["fingerprint"]:
+            raise ValueError(f"Partial {path} belongs to another manifest.")
+        if not 0 <= shard_id < len(manifest["shards"]):
+            raise ValueError(f"Partial {path} has unknown shard {shard_id}.")
+        shard = manifest["shards"][shard_id]
+        if (partial["start"], partial["stop"]) != (shard["start"], shard["stop"]):
+            raise ValueError(f"Partial {path} does not match the range of shard {shard_id}.")
+        if shard_id in seen:
+            raise ValueError(f"Shard {shard_id} is duplicated in {seen[shard_id]} and {path}.")
+        seen[shard_id] = path
+
+        for type, type_histograms in partial["histograms"].items():
+            for column, histogram in type_histograms.items():
+                histograms[type][column].update(histogram)
+        count += partial["count"]
+
+    missing = [s["id"] for s in manifest["shards"] if s["id"] not in seen]
+    if missing and not allow_missing:
+        raise ValueError(f"Missing shards: {missing}.")
+
+    return {
+        "fingerprint": manifest["fingerprint"],
+        "count": count,
+        "shards": sorted(seen),
+        "missing": missing,
+        "histograms": histograms,
+    }
+#endregion
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded enumeration of tile arrangements.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="Split the permutation ranks into shards and write the manifest.")
+    plan.add_argument("manifest")
+    plan.add_argument("--shards", type=int, required=True)
+    plan.add_argument("--start", type=int, default=0)
+    plan.add_argument("--stop", type=int, default=None)
+
+    run = commands.add_parser("run", help="Evaluate one shard and write its partial file.")
+    run.add_argument("manifest")
+    run.add_argument("--shard", type=int, required=True)
+    run.add_argument("--out-dir", default="parts")
+
+    local = commands.add_parser("local", help="Run all incomplete shards as local processes.")
+    local.add_argument("manifest")
+    local.add_argument("--out-dir", default="parts")
+    local.add_argument("--workers", type=int, default=os.cpu_count())
+
+    merge = commands.add_parser("merge", help="Merge partial files into the final histograms.")
+    merge.add_argument("manifest")
+    merge.add_argument("partials", nargs="+")
+    merge.add_argument("--out", default="result.json")
+    merge.add_argument("--allow-missing", action="store_true")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "plan":
+            manifest = make_manifest(args.shards, args.start, args.stop)
+            with open(args.manifest, "w") as file:
+                json.dump(manifest, file, indent=2)
+        elif args.command == "run":
+            print(run_shard(load_manifest(args.manifest), args.shard, args.out_dir))
+        elif args.command == "local":
+            run_local(args.manifest, args.out_dir, args.workers)
+        elif args.command == "merge":
+            result = merge_partials(load_manifest(args.manifest), args.partials, args.allow_missing)
+            with open(args.out, "w") as file:
+                json.dump(result, file, indent=2)
+            if result["missing"]:
+                print(f"Missing shards: {result['missing']}")
+    except (ValueError, RuntimeError) as e:
+        sys.exit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
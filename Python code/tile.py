@@ -1,5 +1,19 @@
 import matplotlib.pyplot as plt
 from collections import defaultdict
+import copy
+
+def transformPoint(point, orientation, size=3):
+    """
+    Transforms a point of a tile into one of the 8 orientations of the square.
+    Orientations 0-3 are rotations by 0, 90, 180 and 270 degrees counterclockwise,
+    orientations 4-7 are the same rotations of the tile mirrored over the vertical axis.
+    """
+    x, y = point
+    if orientation >= 4:
+        x = size - x
+    for _ in range(orientation % 4):
+        x, y = size - y, x
+    return (x, y)
 
 # Class for a tile.
 class Tile:
@@ -10,27 +24,14 @@ class Tile:
 
         self.triangles = self._computeTriangles()
         self.triangles_color = self._colorTriangles()
+        # Neighbouring triangles inside the tile (not separated by a connection). This does not depend on the orientation.
+        self.triangle_neighbours = self._computeTriangleNeighbours()
 
-        # Find the edge points of the tile
-        self.left_edge = []
-        self.right_edge = []
-        self.top_edge = []
-        self.bottom_edge = []
-        for p in points:
-            if p[0] == 0:
-                self.left_edge.append(p)
-            if p[0] == 3:
-                self.right_edge.append(p)
-            if p[1] == 0:
-                self.bottom_edge.append(p)
-            if p[1] == 3:
-                self.top_edge.append(p)
-        
-        # Sort the edge points
-        self.left_edge.sort(key=lambda x: x[1])
-        self.right_edge.sort(key=lambda x: x[1])
-        self.top_edge.sort(key=lambda x: x[0])
-        self.bottom_edge.sort(key=lambda x: x[0])
+        # Size of the tile. As the tile is always square, this is just max of x or y coordinate of the points.
+        self.size = max(self.points, key=lambda x: x[0])[0]
+
+        # Edge points and lookup tables that depend on the positions of the points
+        self._computePorts()
 
         # Neighbouring tiles. Default is None. This is later updated when constructing the map.
         self.left_neighbour = None
@@ -42,8 +43,10 @@ class Tile:
         self.x = 0
         self.y = 0
 
-        # Size of the tile. As the tile is always square, this is just max of x or y coordinate of the points.
-        self.size = max(self.points, key=lambda x: x[0])[0]
+        # Orientation of the tile (see `transformPoint`) and cache of all oriented variants of the tile.
+        # The cache is shared by all copies of the tile, so every variant is computed only once.
+        self.orientation = 0
+        self._orientations = {0: self}
 
     def __str__(self):
         return f"Tile at ({self.x}, {self.y})"
@@ -72,6 +75,102 @@ class Tile:
 
         return list(triangles)
     
+    def _computeTriangleNeighbours(self):
+        # For every triangle find the triangles that share an edge with it, which is not a connection.
+        neighbours = {}
+        for triangle in self.triangles:
+            neighbours[triangle] = []
+            for neighbour in self.triangles:
+                if neighbour == triangle:
+                    continue
+                shared_edge = [
+                    edge
+                    for edge in [(triangle[i], triangle[j]) for i in range(3) for j in range(i + 1, 3)]
+                    if edge in [(neighbour[i], neighbour[j]) for i in range(3) for j in range(i + 1, 3)] or
+                    edge[::-1] in [(neighbour[i], neighbour[j]) for i in range(3) for j in range(i + 1, 3)]
+                ]
+                if shared_edge:
+                    shared_edge_index = self.edges.index(shared_edge[0])
+                    if not shared_edge_index in self.connections:
+                        neighbours[triangle].append(neighbour)
+        return neighbours
+
+    def _computePorts(self):
+        # Find the edge points of the tile
+        self.left_edge = []
+        self.right_edge = []
+        self.top_edge = []
+        self.bottom_edge = []
+        for p in self.points:
+            if p[0] == 0:
+                self.left_edge.append(p)
+            if p[0] == 3:
+                self.right_edge.append(p)
+            if p[1] == 0:
+                self.bottom_edge.append(p)
+            if p[1] == 3:
+                self.top_edge.append(p)
+        
+        # Sort the edge points
+        self.left_edge.sort(key=lambda x: x[1])
+        self.right_edge.sort(key=lambda x: x[1])
+        self.top_edge.sort(key=lambda x: x[0])
+        self.bottom_edge.sort(key=lambda x: x[0])
+
+        # Index of every point and indices of points that are an end of a connection
+        self.point_index = {p: i for i, p in enumerate(self.points)}
+        self.connected_points = set()
+        for edge_index in self.connections:
+            self.connected_points.update(self.edges[edge_index])
+
+        # Triangles with an edge on a side of the tile, by the points of that edge
+        self.side_triangles = {'left': {}, 'right': {}, 'top': {}, 'bottom': {}}
+        # Sides of the tile that each triangle touches with an edge, with the points of that edge
+        # in the coordinates of the neighbouring tile on that side
+        self.triangle_sides = {}
+        for triangle in self.triangles:
+            self.triangle_sides[triangle] = []
+            commonLeft = self.trianglePointsOnLeftEdge(triangle)
+            commonRight = self.trianglePointsOnRightEdge(triangle)
+            commonTop = self.trianglePointsOnTopEdge(triangle)
+            commonBottom = self.trianglePointsOnBottomEdge(triangle)
+            if len(commonLeft) == 2:
+                self.side_triangles['left'][frozenset(commonLeft)] = triangle
+                self.triangle_sides[triangle].append(('left', frozenset((x + 3, y) for (x, y) in commonLeft)))
+            elif len(commonRight) == 2:
+                self.side_triangles['right'][frozenset(commonRight)] = triangle
+                self.triangle_sides[triangle].append(('right', frozenset((x - 3, y) for (x, y) in commonRight)))
+
+            if len(commonTop) == 2:
+                self.side_triangles['top'][frozenset(commonTop)] = triangle
+                self.triangle_sides[triangle].append(('top', frozenset((x, y - 3) for (x, y) in commonTop)))
+            elif len(commonBottom) == 2:
+                self.side_triangles['bottom'][frozenset(commonBottom)] = triangle
+                self.triangle_sides[triangle].append(('bottom', frozenset((x, y + 3) for (x, y) in commonBottom)))
+
+    def oriented(self, orientation):
+        """
+        Returns the variant of the tile in the given orientation (see `transformPoint`).
+        Variants are computed once and cached, so they must not be modified. `Map.setTile` places a copy.
+        """
+        if orientation not in self._orientations:
+            if orientation not in range(8):
+                raise ValueError(f"Invalid orientation {orientation}.")
+            base = self._orientations[0]
+            variant = copy.copy(base)
+            # Triangles, their colors and neighbours are given by point indices, so only the points move
+            variant.points = [transformPoint(p, orientation, base.size) for p in base.points]
+            variant._computePorts()
+            variant.orientation = orientation
+            variant.x = 0
+            variant.y = 0
+            variant.left_neighbour = None
+            variant.right_neighbour = None
+            variant.top_neighbour = None
+            variant.bottom_neighbour = None
+            self._orientations[orientation] = variant
+        return self._orientations[orientation]
+
     def _colorTriangles(self):
         # Find the starting triangle
         start_point_index = self.points.index((0, 0))
@@ -161,46 +260,46 @@ class Tile:
         elif direction == 'bottom':
             self.bottom_neighbour = tile
 
-    def getTriangleNeighbours(self):
+    def seamCrossing(self, direction):
+        """
+        Returns the winding step (dx, dy) taken when stepping from this tile to its neighbour in `direction`.
+        The step is non-zero only when the neighbour is reached by wrapping around the map (cylinder or torus seam).
+        """
+        if direction == 'left' and self.left_neighbour is not None and self.left_neighbour.x >= self.x:
+            return (-1, 0)
+        if direction == 'right' and self.right_neighbour is not None and self.right_neighbour.x <= self.x:
+            return (1, 0)
+        if direction == 'top' and self.top_neighbour is not None and self.top_neighbour.y <= self.y:
+            return (0, 1)
+        if direction == 'bottom' and self.bottom_neighbour is not None and self.bottom_neighbour.y >= self.y:
+            return (0, -1)
+        return (0, 0)
+
+    def getNeighbour(self, direction):
+        if direction == 'left':
+            return self.left_neighbour
+        elif direction == 'right':
+            return self.right_neighbour
+        elif direction == 'top':
+            return self.top_neighbour
+        elif direction == 'bottom':
+            return self.bottom_neighbour
+
+    def getTriangleNeighbours(self, crossings=None):
+        # If `crossings` dict is given, it is filled with the winding step of every neighbour pair that crosses a seam.
+        opposite = {'left': 'right', 'right': 'left', 'top': 'bottom', 'bottom': 'top'}
         dict = {}
         for triangle in self.triangles:
-            t = self.globalTriangleRepresentation(tuple(triangle))
-            dict[t] = []
-            for neighbour in self.triangles:
-                if neighbour == triangle:
-                    continue
-                shared_edge = [
-                    edge
-                    for edge in [(triangle[i], triangle[j]) for i in range(3) for j in range(i + 1, 3)]
-                    if edge in [(neighbour[i], neighbour[j]) for i in range(3) for j in range(i + 1, 3)] or
-                    edge[::-1] in [(neighbour[i], neighbour[j]) for i in range(3) for j in range(i + 1, 3)]
-                ]
-                if shared_edge:
-                    shared_edge_index = self.edges.index(shared_edge[0])
-                    if not shared_edge_index in self.connections:
-                        dict[t].append(self.globalTriangleRepresentation(neighbour))
-
-            commonLeft = self.trianglePointsOnLeftEdge(triangle)
-            commonRight = self.trianglePointsOnRightEdge(triangle)
-            commonTop = self.trianglePointsOnTopEdge(triangle)
-            commonBottom = self.trianglePointsOnBottomEdge(triangle)
-            if len(commonLeft) == 2:
-                if self.left_neighbour is not None:
-                    commonLeft = [(x + 3, y) for (x, y) in commonLeft]
-                    dict[t].append(self.left_neighbour.globalTriangleRepresentation(self.left_neighbour.findTriangleWithPoints(commonLeft)))
-            elif len(commonRight) == 2:
-                if self.right_neighbour is not None:
-                    commonRight = [(x - 3, y) for (x, y) in commonRight]
-                    dict[t].append(self.right_neighbour.globalTriangleRepresentation(self.right_neighbour.findTriangleWithPoints(commonRight)))
+            t = self.globalTriangleRepresentation(triangle)
+            dict[t] = [self.globalTriangleRepresentation(neighbour) for neighbour in self.triangle_neighbours[triangle]]
 
-            if len(commonTop) == 2:
-                if self.top_neighbour is not None:
-                    commonTop = [(x, y - 3) for (x, y) in commonTop]
-                    dict[t].append(self.top_neighbour.globalTriangleRepresentation(self.top_neighbour.findTriangleWithPoints(commonTop)))
-            elif len(commonBottom) == 2:
-                if self.bottom_neighbour is not None:
-                    commonBottom = [(x, y + 3) for (x, y) in commonBottom]
-                    dict[t].append(self.bottom_neighbour.globalTriangleRepresentation(self.bottom_neighbour.findTriangleWithPoints(commonBottom)))
+            for side, common in self.triangle_sides[triangle]:
+                neighbour_tile = self.getNeighbour(side)
+                if neighbour_tile is not None:
+                    neighbour = neighbour_tile.globalTriangleRepresentation(neighbour_tile.side_triangles[opposite[side]][common])
+                    dict[t].append(neighbour)
+                    if crossings is not None and self.seamCrossing(side) != (0, 0):
+                        crossings[(t, neighbour)] = self.seamCrossing(side)
 
         return dict
 
@@ -213,16 +312,6 @@ class Tile:
     def get_global_coordinates(self, point):
         return (point[0] + self.x * self.size, point[1] + self.y * self.size)
     
-    def findTriangleWithPoints(self, points):
-        for triangle in self.triangles:
-            common = 0
-            for i in triangle:
-                if self.points[i] in points:
-                    common += 1
-            if common == 2:
-                return triangle
-        raise ValueError("Triangle not found.")
-
     def trianglePointsOnLeftEdge(self, triangle):
         common = []
         for i in triangle: